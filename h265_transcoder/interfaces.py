@@ -1,14 +1,76 @@
-"""Contains the SQLite database connection class."""
+"""Contains the SQLite database connection and exiftool process classes."""
 
+import atexit
 import logging
+import os
 import sqlite3
+import subprocess
+import threading
 
 logger = logging.getLogger("app")
 
+# Tuned once for every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL ;",
+    "PRAGMA synchronous = NORMAL ;",
+    "PRAGMA temp_store = MEMORY ;",
+    "PRAGMA mmap_size = 268435456 ;",
+    "PRAGMA busy_timeout = 5000 ;",
+    "PRAGMA cache_size = -65536 ;",
+)
+
+# Open connections of each thread, keyed by process ID and database file.
+# Connections are never shared with forked worker processes.
+_TLS = threading.local()
+# Every open connection with its process ID, to close them on exit
+_OPEN_CONNECTIONS = []
+
+
+def _close_all() -> None:
+    """Close every open database connection owned by this process."""
+    pid = os.getpid()
+    for owner_pid, db_connect in _OPEN_CONNECTIONS:
+        if owner_pid == pid:
+            db_connect.close()
+    _OPEN_CONNECTIONS.clear()
+
+
+atexit.register(_close_all)
+
+
+def configure_db(db_connect: sqlite3.Connection) -> None:
+    """Apply the connection PRAGMAs to a new SQLite connection."""
+    for pragma in PRAGMAS:
+        db_connect.execute(pragma)
+
+
+def get_connection(db_file: str) -> sqlite3.Connection:
+    """Get the SQLite connection of the current thread, opening it on first use.
+
+    Args:
+        db_file (str): SQLite database file to use.
+
+    Returns:
+        Connection to the SQLite database file.
+    """
+    connections = getattr(_TLS, "connections", None)
+    if connections is None:
+        connections = _TLS.connections = {}
+    key = (os.getpid(), str(db_file))
+    db_connect = connections.get(key)
+    if db_connect is None:
+        db_connect = sqlite3.connect(db_file, check_same_thread=False, cached_statements=256)
+        configure_db(db_connect)
+        connections[key] = db_connect
+        _OPEN_CONNECTIONS.append((key[0], db_connect))
+    return db_connect
+
+
 class DatabaseInterface:
     """Interface with the SQLite database.
 
     Ensure the SQLite database file is accessible, and a cursor is available.
+    Each thread keeps its connection open, and reuses it for the same file.
     """
     def __init__(self, db_file: str):
         """Create the SQLite database connection."""
@@ -20,7 +82,7 @@ class DatabaseInterface:
     def __enter__(self) -> tuple[sqlite3.Connection, sqlite3.Cursor]:
         """Connects to the database, and returns the connection and cursor."""
         try:
-            self.db_connect = sqlite3.connect(self.db_file)
+            self.db_connect = get_connection(self.db_file)
             self.db_cursor = self.db_connect.cursor()
         except sqlite3.Error:
             logger.error("Failed to connect to the database.")
@@ -30,11 +92,91 @@ class DatabaseInterface:
         return self.db_connect, self.db_cursor
 
     def __exit__(self, exception_type, exception_value, exception_traceback) -> None:
-        """Close the database connection."""
+        """Commit the changes, and keep the connection open for reuse."""
         if exception_type:
-            exception_msg = f"An exception occurred: {exception_type}, {exception_value}"
-            logger.error(exception_msg)
+            logger.error("An exception occurred: %s, %s", exception_type, exception_value)
 
         self.db_connect.commit()
-        self.db_connect.close()
-        logger.debug("Database connection closed.")
+        self.db_cursor.close()
+        logger.debug("Database cursor closed.")
+
+
+class ExiftoolDaemon:
+    """Interface with a persistent exiftool process.
+
+    Exiftool is started once with '-stay_open', and reads the arguments for
+    each command from stdin. This avoids the Perl startup for every video file.
+    """
+    def __init__(self, exiftool: str = "/usr/bin/exiftool"):
+        """Setup the exiftool executable, without starting the process."""
+        self.exiftool = exiftool
+        self.process = None
+        self.pid = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def start(self) -> None:
+        """Start the persistent exiftool process."""
+        logger.debug("Starting exiftool daemon.")
+        self.process = subprocess.Popen([self.exiftool, "-stay_open", "True", "-@", "-"],
+                                        stdin = subprocess.PIPE,
+                                        stdout = subprocess.PIPE,
+                                        stderr = subprocess.DEVNULL,
+                                        text = True,
+                                        encoding = "utf-8",
+                                        errors = "surrogateescape",
+                                        bufsize = 1 << 20)
+        self.pid = os.getpid()
+
+    def query(self, args: list[str]) -> str:
+        """Run an exiftool command, and return its output.
+
+        Args:
+            args (list): exiftool arguments, one per item.
+
+        Returns:
+            The stdout of the exiftool command.
+
+        Raises:
+            subprocess.CalledProcessError: exiftool returned a non-zero status,
+                or an argument contains a line break.
+        """
+        # Arguments are sent one per line, so a line break would split them
+        if any("\n" in arg or "\r" in arg for arg in args):
+            logger.error("Exiftool argument contains a line break: %r", args)
+            raise subprocess.CalledProcessError(-1, [self.exiftool, *args])
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            command = [*args, "-echo3", "${status}", "-execute"]
+            self.process.stdin.write("\n".join(command) + "\n")
+            self.process.stdin.flush()
+
+            lines = []
+            while (line := self.process.stdout.readline()) != "{ready}\n":
+                if not line:
+                    self.process = None
+                    raise subprocess.CalledProcessError(-1, [self.exiftool, *args])
+                lines.append(line)
+
+        try:
+            status = int(lines.pop()) if lines else -1
+        except ValueError:
+            status = -1
+        output = "".join(lines)
+        if status:
+            raise subprocess.CalledProcessError(status, [self.exiftool, *args], output)
+        return output
+
+    def close(self) -> None:
+        """Stop the persistent exiftool process."""
+        if self.process is None or self.pid != os.getpid():
+            return
+        try:
+            self.process.stdin.write("-stay_open\nFalse\n")
+            self.process.stdin.flush()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process = None
+        logger.debug("Exiftool daemon stopped.")
@@ -4,4 +4,7 @@ CREATE TABLE IF NOT EXISTS queue (
     filename TEXT UNIQUE NOT NULL,
     transcode TEXT DEFAULT "N" NOT NULL,
     status TEXT DEFAULT "skipped" NOT NULL
-);
\ No newline at end of file
+);
+CREATE INDEX IF NOT EXISTS idx_queue_status_transcode_id ON queue (status, transcode, id, path, filename);
+
+CREATE INDEX IF NOT EXISTS idx_queue_path_filename ON queue (path, filename);
@@ -1,20 +1,197 @@
 """Defines all of the jobs and shared functions."""
 
-import datetime
+import functools
+import itertools
 import logging
+import mmap
 import os
 import sqlite3
+import struct
 import subprocess
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
 
-from ffmpeg import FFmpeg, FFmpegError, Progress
+from h265_transcoder import config, log
+from h265_transcoder.interfaces import DatabaseInterface, ExiftoolDaemon
 
-from h265_transcoder import config
-from h265_transcoder.interfaces import DatabaseInterface
+try:
+    import PyNvVideoCodec as nvc
+except ImportError:
+    nvc = None
 
 logger = logging.getLogger("app")
-BATCH = os.getenv("BATCH", "0")
-DELETE = bool(os.environ["DELETE"].lower() == "true")
+
+
+def parse_batch(batch_value: str) -> int | None:
+    """Parse the BATCH environment variable into a batch limit.
+
+    Args:
+        batch_value (str): value of the BATCH environment variable.
+
+    Returns:
+        The batch limit, or None for unlimited.
+    """
+    try:
+        batch = int(batch_value)
+    except ValueError:
+        logger.error("BATCH is not an integer. BATCH=%r.", batch_value)
+        logger.info("Setting batch to unlimited.")
+        return None
+
+    if batch == 0:
+        logger.info("Batch is 0; unlimited.")
+        return None
+    if batch < 0:
+        logger.warning("batch=%s. BATCH variable must be a positive number.", batch)
+        logger.info("Batch is '%s'. Setting to unlimited.", batch)
+        return None
+    logger.info("Setting batch limit to %s.", batch)
+    return batch
+
+
+def parse_parallel(parallel_value: str, default: int = 2) -> int:
+    """Parse the PARALLEL environment variable into a worker count.
+
+    Args:
+        parallel_value (str): value of the PARALLEL environment variable.
+        default (int): worker count used for invalid values.
+
+    Returns:
+        The amount of files to transcode at the same time.
+    """
+    try:
+        parallel = int(parallel_value)
+    except ValueError:
+        logger.error("PARALLEL is not an integer. PARALLEL=%r.", parallel_value)
+        logger.info("Setting parallel transcodes to %s.", default)
+        return default
+
+    if parallel < 1:
+        logger.warning("parallel=%s. PARALLEL variable must be a positive number.", parallel)
+        logger.info("Setting parallel transcodes to 1.")
+        return 1
+    return parallel
+
+
+BATCH_LIMIT = parse_batch(os.getenv("BATCH", "0"))
+DELETE = bool(os.getenv("DELETE", "False").strip().lower() == "true")
+HW_ACCEL = bool(os.getenv("HW_ACCEL", "False").lower() == "true")
+PYNVC = bool(HW_ACCEL and nvc is not None and Path("/dev/nvidia0").exists())
+PARALLEL = parse_parallel(os.getenv("PARALLEL", "2"))
+ENCODE_THREADS = max(1, (os.cpu_count() or 1) // PARALLEL)
+NUMA_NODES = max(1, len(list(Path("/sys/devices/system/node").glob("node[0-9]*"))))
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+SCAN_CHUNK = 500
+INSERT_CHUNK = 1000
+SCAN_PATH = "/mnt"
+VIDEO_EXTENSIONS = (".mkv", ".mp4")
+# Output file extension for each input file extension
+OUTPUT_EXTENSIONS = {"mkv": "mp4", "mp4": "h265"}
+
+# One exiftool process per scanning thread
+exiftool_local = threading.local()
+exiftool_daemons = []
+
+PROGRESS_FORMAT = "File=%s Frame=%s FPS=%s Size=%sB Time=%s Bitrate=%skb/s Speed=%sx"
+
+# SQL statements are reused as-is to hit the connection's statement cache
+ANALYZE_STATEMENT = "ANALYZE queue ;"
+BATCH_QUERY = "SELECT path, filename FROM queue WHERE transcode = 'Y' AND status = 'queued' ORDER BY id ;"
+BATCH_LIMIT_QUERY = "SELECT path, filename FROM queue WHERE transcode = 'Y' AND status = 'queued' ORDER BY id LIMIT ? ;"
+FAILED_QUERY = "SELECT path, filename FROM queue WHERE status = 'failed' ;"
+INSERT_STATEMENT = """INSERT OR IGNORE INTO queue (
+                            path, filename, transcode, status)
+                        VALUES (
+                            ?, ?, ?, ?) ;
+"""
+METADATA_QUERY = "SELECT path, filename FROM queue ;"
+QUEUE_COUNT_QUERY = "SELECT COUNT(*) FROM queue ;"
+STATUS_COUNT_QUERY = "SELECT status, COUNT(status) FROM queue GROUP BY status ;"
+STATUS_UPDATE_QUERY = """UPDATE queue
+                            SET status = ?
+                            WHERE path = ? AND
+                            filename = ? ;
+"""
+
+# Hardware HEVC encoders in order of preference, with their decode (input)
+# and encode (output) options. Decoded frames stay in GPU memory.
+HW_ENCODERS = {
+    "hevc_nvenc": (
+        {"hwaccel": "cuda", "hwaccel_output_format": "cuda"},
+        {"preset": "p4", "rc": "vbr", "cq": "23"},
+    ),
+    "hevc_qsv": (
+        {"hwaccel": "qsv", "hwaccel_output_format": "qsv"},
+        {"preset": "medium", "global_quality": "23"},
+    ),
+    "hevc_vaapi": (
+        {"hwaccel": "vaapi",
+         "hwaccel_output_format": "vaapi",
+         "hwaccel_device": "/dev/dri/renderD128"},
+        {"rc_mode": "CQP", "qp": "23"},
+    ),
+}
+
+# Trial encode of a blank video, to check the hardware behind each encoder.
+# VA-API only encodes frames uploaded to the GPU.
+HW_PROBE_INPUT = ["-f", "lavfi", "-i", "nullsrc=s=256x256:d=0.1"]
+HW_PROBE_OPTIONS = {
+    "hevc_vaapi": ["-vaapi_device", "/dev/dri/renderD128", "-vf", "format=nv12,hwupload"],
+}
+
+# CPU encoding options, tuned for throughput. The thread pool of each
+# transcoding is sized to its share of the CPU threads, split evenly over
+# every NUMA node. A single pools value would only use NUMA node 0.
+X265_POOLS = ",".join([str(max(1, ENCODE_THREADS // NUMA_NODES))] * NUMA_NODES)
+X265_OPTIONS = {
+    "preset": os.getenv("X265_PRESET", "faster"),
+    "crf": os.getenv("X265_CRF", "24"),
+    "x265-params": os.getenv("X265_PARAMS", f"pools={X265_POOLS}"),
+}
+
+
+class StatusWriter:
+    """Buffer the status updates of video files, and write them together."""
+    def __init__(self, sqlite_db: str) -> None:
+        """Setup the buffer of status updates.
+
+        Args:
+            sqlite_db (str): SQLite database file to use.
+        """
+        self.sqlite_db = sqlite_db
+        self.buffer = []
+
+
+    def queue(self, path: str, filename: str, status: str) -> None:
+        """Buffer the new status of the video file.
+
+        Args:
+            path (str): path for the video file.
+            filename (str): filename for the video file.
+            status (str): new status for the video file.
+        """
+        self.buffer.append((status, path, filename))
+
+
+    def flush(self) -> None:
+        """Write all buffered status updates in a single transaction."""
+        if not self.buffer:
+            return
+        with DatabaseInterface(self.sqlite_db) as (_connect, db_cursor):
+            try:
+                db_cursor.executemany(STATUS_UPDATE_QUERY, self.buffer)
+            except sqlite3.Error:
+                logger.debug("self.buffer=%r", self.buffer)
+                logger.error("SQLite transcode status update failed.")
+                logger.exception(sqlite3.Error)
+            else:
+                for status, path, filename in self.buffer:
+                    logger.info("Updated status for '%s/%s' to '%s'.", path, filename, status)
+            finally:
+                self.buffer.clear()
 
 
 class Transcode:
@@ -30,13 +207,12 @@ class Transcode:
         self.sqlite_db = sqlite_db
         self.path = path
         self.filename = filename
-        self.input_file = f"{self.path}/{self.filename}"
-        if self.filename.endswith(".mkv"):
-            self.output_file = self.input_file.replace(".mkv", ".mp4")
-            self.video_title = self.filename.removesuffix(".mkv")
-        elif self.filename.endswith(".mp4"):
-            self.output_file = self.input_file.replace(".mp4", ".h265")
-            self.video_title = self.filename.removesuffix(".mp4")
+        self.input_file = os.path.join(self.path, self.filename)
+        self.video_title, _, self.extension = self.filename.rpartition(".")
+        output_filename = f"{self.video_title}.{OUTPUT_EXTENSIONS[self.extension]}"
+        self.output_file = os.path.join(self.path, output_filename)
+        self.encoder = probe_encoders() if HW_ACCEL else "libx265"
+        self.input_options, self.encoder_options = HW_ENCODERS.get(self.encoder, ({}, X265_OPTIONS))
 
 
     def transcode(self) -> str:
@@ -45,100 +221,209 @@ class Transcode:
         During the transcoding, metadata will be cleaned up.
         Title tag will match the filename without an extension.
         Comment tag will be cleared.
+        The final status is returned for the caller to write to the database.
 
         Returns:
             transcode_status: "done" for success, "failed" for errors.
         """
         update_status(self.sqlite_db, self.path, self.filename, "active")
-        ffmpeg = (
-            FFmpeg()
-            .option("y")
-            .input(self.input_file)
-            .output(
-                self.output_file,
-                {
-                    "codec:v": "libx265",
-                    "vtag": "hvc1",
-                    "codec:a": "copy",
-                    "metadata": [
-                                    f"title={self.video_title}",
-                                    "comment="
-                                 ],
-                    "f": "mp4"
-                }
-            )
-        )
-
-        @ffmpeg.on("start")
-        def on_start(command: list[str]):
-            ffmpeg_cmd_msg = f"{command=}"
-            logger.debug(ffmpeg_cmd_msg)
-
-        @ffmpeg.on("progress")
-        def on_progress(progress: Progress):
-            frame = progress.frame
-            fps = int(progress.fps)
-            size = (str(progress.size) + "B")
-            try:
-                seconds = datetime.datetime.strptime(str(progress.time), "%H:%M:%S.%f")
-            except ValueError:
-                seconds = datetime.datetime.strptime(str(progress.time), "%H:%M:%S")
-            time = seconds.strftime("%H:%M:%S.") + str(seconds.strftime("%f"))[:2]
-            bitrate = str(progress.bitrate) + "kb/s"
-            speed = (str(progress.speed) + "x")
-            progress_bar = (
-                f"File={self.filename} "
-                f"Frame={frame} "
-                f"FPS={fps} "
-                f"Size={size} "
-                f"Time={time} "
-                f"Bitrate={bitrate} "
-                f"Speed={speed}"
-            )
-            logger.transcode(progress_bar)
+        command = self.build_command()
+        logger.debug("command=%r", command)
 
         try:
-            transcode_msg = f"Transcoding '{self.input_file}' to '{self.output_file}'."
-            logger.info(transcode_msg)
-            ffmpeg.execute()
-        except FFmpegError:
+            logger.info("Transcoding '%s' to '%s'.", self.input_file, self.output_file)
+            if not (PYNVC and self.transcode_pynvc()):
+                self.run_ffmpeg(command)
+        except (OSError, subprocess.CalledProcessError) as ffmpeg_error:
             transcode_status = "failed"
-            transcode_err_msg = f"Failed to transcode '{self.input_file}'"
-            logger.error(transcode_err_msg)
-            if Path(self.output_file).exists():
+            logger.error("Failed to transcode '%s'", self.input_file)
+            if getattr(ffmpeg_error, "stderr", None):
+                logger.debug("ffmpeg: %s", ffmpeg_error.stderr)
+            if os.path.exists(self.output_file):
                 logger.debug("Removing the failed output file.")
-                Path(self.output_file).unlink()
+                os.unlink(self.output_file)
                 logger.debug("Removed output file.")
             else:
-                cleanup_msg = f"Nothing to remove. '{self.output_file}' not found."
-                logger.debug(cleanup_msg)
+                logger.debug("Nothing to remove. '%s' not found.", self.output_file)
         else:
             transcode_status = "done"
-            success_msg = f"'{self.input_file}' transcoded successfully."
-            logger.info(success_msg)
+            logger.info("'%s' transcoded successfully.", self.input_file)
             input_size = get_file_size(self.input_file)
             output_size = get_file_size(self.output_file)
             diff_size = input_size-output_size
-            diff_size_msg = f"Recovered {diff_size:,} bytes in trandcoding."
-            logger.info(diff_size_msg)
-        finally:
-            update_status(self.sqlite_db, self.path, self.filename, transcode_status)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Recovered %s bytes in trandcoding.", f"{diff_size:,}")
         return transcode_status
 
 
+    def build_command(self) -> list[str]:
+        """Build the ffmpeg command for the video file.
+
+        Progress is only written to stdout when the transcode log level is enabled.
+
+        Returns:
+            List of the ffmpeg command arguments.
+        """
+        command = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-y"]
+        for option, value in self.input_options.items():
+            command += [f"-{option}", value]
+        command += ["-i", self.input_file, "-codec:v", self.encoder]
+        for option, value in self.encoder_options.items():
+            command += [f"-{option}", value]
+        command += ["-vtag", "hvc1",
+                    "-threads", str(ENCODE_THREADS),
+                    "-codec:a", "copy",
+                    "-metadata", f"title={self.video_title}",
+                    "-metadata", "comment=",
+                    "-f", "mp4"]
+        if logger.isEnabledFor(log.TRANSCODE):
+            command += ["-progress", "pipe:1"]
+        command.append(self.output_file)
+        return command
+
+
+    def run_ffmpeg(self, command: list[str]) -> None:
+        """Run ffmpeg, and log its progress.
+
+        ffmpeg writes the progress as blocks of 'key=value' lines,
+        and each block ends with a 'progress' line.
+
+        Args:
+            command (list): ffmpeg command arguments.
+
+        Raises:
+            subprocess.CalledProcessError: ffmpeg returned a non-zero status.
+        """
+        progress_pipe = subprocess.PIPE if "-progress" in command else subprocess.DEVNULL
+        with tempfile.TemporaryFile() as ffmpeg_errors:
+            with subprocess.Popen(command,
+                                  stdout = progress_pipe,
+                                  stderr = ffmpeg_errors,
+                                  text = True,
+                                  bufsize = 1 << 20) as ffmpeg:
+                if ffmpeg.stdout:
+                    progress = {}
+                    for line in ffmpeg.stdout:
+                        key, _, value = line.rstrip().partition("=")
+                        progress[key] = value
+                        if key == "progress":
+                            self.log_progress(progress)
+            if ffmpeg.returncode:
+                ffmpeg_errors.seek(0)
+                error_output = ffmpeg_errors.read().decode(errors="replace").strip()
+                raise subprocess.CalledProcessError(ffmpeg.returncode, command, stderr=error_output)
+
+
+    def transcode_pynvc(self) -> bool:
+        """Transcode the video stream on the GPU with PyNvVideoCodec.
+
+        NVDEC decodes the frames into GPU memory, and NVENC encodes them
+        to a raw HEVC stream. ffmpeg then muxes it with the original audio.
+
+        Returns:
+            True if transcoded, False to fall back to ffmpeg for the whole transcoding.
+        """
+        video_stream = f"{self.output_file}.hevc"
+        try:
+            demuxer = nvc.CreateDemuxer(filename=self.input_file)
+            decoder = nvc.CreateDecoder(gpuid=0,
+                                        codec=demuxer.GetNvCodecId(),
+                                        cudacontext=0,
+                                        cudastream=0,
+                                        usedevicememory=True)
+            encoder = nvc.CreateEncoder(demuxer.Width(), demuxer.Height(), "NV12", False,
+                                        codec="hevc",
+                                        preset="P4")
+            with Path(video_stream).open(mode="wb") as hevc:
+                for packet in demuxer:
+                    for frame in decoder.Decode(packet):
+                        hevc.write(bytearray(encoder.Encode(frame)))
+                hevc.write(bytearray(encoder.EndEncode()))
+            mux_command = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-y",
+                           "-i", self.input_file,
+                           "-framerate", str(demuxer.FrameRate()),
+                           "-i", video_stream,
+                           "-map", "1:v:0",
+                           "-map", "0:a:0?",
+                           "-codec", "copy",
+                           "-vtag", "hvc1",
+                           "-metadata", f"title={self.video_title}",
+                           "-metadata", "comment=",
+                           "-f", "mp4",
+                           self.output_file]
+            self.run_ffmpeg(mux_command)
+        # PyNvVideoCodec raises various exception types for unsupported inputs
+        except Exception:
+            logger.warning("PyNvVideoCodec failed for '%s'. Using ffmpeg.", self.input_file)
+            logger.debug("PyNvVideoCodec exception.", exc_info=True)
+            return False
+        finally:
+            if os.path.exists(video_stream):
+                os.unlink(video_stream)
+        return True
+
+
+    def log_progress(self, progress: dict[str, str]) -> None:
+        """Log the ffmpeg transcoding progress.
+
+        Args:
+            progress (dict): latest 'key=value' pairs from the ffmpeg progress.
+        """
+        logger.transcode(PROGRESS_FORMAT,
+                         self.filename,
+                         progress.get("frame"),
+                         progress.get("fps", "0").partition(".")[0],
+                         progress.get("total_size"),
+                         format_time(progress.get("out_time", "00:00:00")),
+                         progress.get("bitrate", "").removesuffix("kbits/s"),
+                         progress.get("speed", "").removesuffix("x"))
+
+
     def delete_original(self) -> None:
         """Remove the original input file.
 
         MKV transcoding outputs to MP4 file, and the original MKV will be deleted.
         MP4 transcoding outputs to ".h265" MP4, which will overwrite the ".mp4" file.
         """
-        if self.input_file.endswith(".mkv"):
-            Path(self.input_file).unlink()
-            cleanup_msg = f"Deleted '{self.input_file}'."
-        elif self.input_file.endswith(".mp4"):
-            Path(self.output_file).replace(self.input_file)
-            cleanup_msg = f"Renamed '{self.output_file}' to '{self.input_file}'."
-        logger.info(cleanup_msg)
+        if self.extension == "mkv":
+            os.unlink(self.input_file)
+            logger.info("Deleted '%s'.", self.input_file)
+        elif self.extension == "mp4":
+            os.replace(self.output_file, self.input_file)
+            logger.info("Renamed '%s' to '%s'.", self.output_file, self.input_file)
+
+
+def chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    """Split an iterable into lists of a maximum size.
+
+    Args:
+        iterable (Iterable): items to split.
+        size (int): maximum amount of items per list.
+
+    Yields:
+        List of the next items.
+    """
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def check_video(path: str, filename: str) -> tuple:
+    """Check whether the video file needs to be transcoded.
+
+    MKV files are always transcoded, and other files have their metadata read.
+
+    Args:
+        path (str): Absolute path to the video file.
+        filename (str): Filename for the video.
+
+    Returns:
+        Tuple of the filename and transcoding status.
+    """
+    if filename.endswith(".mkv"):
+        logger.info("'%s/%s' needs to be transcoded.", path, filename)
+        return (filename, "Y", "queued")
+    return read_metadata(path, filename)
 
 
 def final_results(sqlite_db: str) -> None:
@@ -154,83 +439,88 @@ def final_results(sqlite_db: str) -> None:
         "skipped": 0,
         "unknown": 0
     }
-    status_query = "SELECT status, COUNT(status) FROM queue GROUP BY status ;"
-    failed_query = "SELECT path, filename FROM queue WHERE status = 'failed' ;"
     with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
         try:
-            status_result = db_cursor.execute(status_query)
-            status_data = status_result.fetchall()
-            failed_result = db_cursor.execute(failed_query)
-            failed_data = failed_result.fetchall()
+            states.update(db_cursor.execute(STATUS_COUNT_QUERY))
+
+            logger.info("%(done)s done, %(failed)s failed, %(queued)s queued, "
+                        "%(skipped)s skipped, %(unknown)s unknown.", states)
+
+            # Stream the failed files from the cursor, as the list can be large
+            for path, filename in db_cursor.execute(FAILED_QUERY):
+                logger.info("Failed to transcode '%s/%s'.", path, filename)
         except sqlite3.Error:
             logger.error("SQLite status query failed.")
             logger.exception(sqlite3.Error)
         else:
             db_cursor.close()
 
-    for values in status_data:
-        states[values[0]] = values[1]
 
-    final_count_msg = (f"{states["done"]} done, {states["failed"]} failed, "
-                       f"{states["queued"]} queued, {states["skipped"]} skipped, "
-                       f"{states['unknown']} unknown.")
-    logger.info(final_count_msg)
+def find_box(data: mmap.mmap, start: int, end: int, box_type: bytes) -> tuple[int, int] | None:
+    """Find the first ISO-BMFF (MP4) box of a type between two offsets.
+
+    Args:
+        data (mmap): memory-mapped video file.
+        start (int): offset of the first box.
+        end (int): offset where the boxes end.
+        box_type (bytes): four character box type to find.
+
+    Returns:
+        Tuple of the offset of the box content and the box end, or None if not found.
+    """
+    for child_type, child_start, child_end in iter_boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def format_time(time: str) -> str:
+    """Format the ffmpeg progress time to hundredths of a second.
 
-    if failed_data:
-        for path, filename in failed_data:
-            failed_file = f"{path}/{filename}"
-            failed_result_msg = f"Failed to transcode '{failed_file}'."
-            logger.info(failed_result_msg)
+    Args:
+        time (str): progress time as 'H:MM:SS' or 'H:MM:SS.ffffff'.
+
+    Returns:
+        Progress time as 'HH:MM:SS.ff', or the unchanged time (i.e.: 'N/A').
+    """
+    hms, _, fraction = time.partition(".")
+    units = hms.split(":")
+    if len(units) != 3 or not all(unit.isdigit() for unit in units):
+        return time
+    return f"{hms:0>8}.{(fraction + '00')[:2]}"
 
 
 def get_batch(sqlite_db: str) -> list:
     """Obtain a list of files to transcode based on batch limit.
 
+    The batch limit is parsed once from the BATCH environment variable.
+
     Args:
         sqlite_db (str): SQLite database file to use.
 
     Returns:
         List of tuples containing the '(path, filename)' of files to transcode.
     """
-    try:
-        batch = int(BATCH)
-    except ValueError:
-        value_error_msg = f"BATCH is not an integer. {BATCH=}."
-        logger.error(value_error_msg)
-        logger.info("Setting batch to unlimited.")
-        limit = None
+    if BATCH_LIMIT:
+        batch_queue = query_all(sqlite_db, BATCH_LIMIT_QUERY, (BATCH_LIMIT,))
     else:
-        if batch == 0:
-            logger.info("Batch is 0; unlimited.")
-            limit = None
-        elif batch > 0:
-            batch_msg = f"Setting batch limit to {batch}."
-            logger.info(batch_msg)
-            limit = batch
-        elif batch < 0:
-            batch_msg = f"{batch=}. BATCH variable must be a positive number."
-            logger.warning(batch_msg)
-            negative_msg = f"Batch is '{batch}'. Setting to unlimited."
-            logger.info(negative_msg)
-            limit = None
-        else:
-            limit = None
+        batch_queue = query_all(sqlite_db, BATCH_QUERY)
+    logger.info("Successfully retrieved batch of files to transcode.")
+    return batch_queue
 
-    batch_query = "SELECT path, filename FROM queue WHERE transcode = 'Y' AND status = 'queued' ;"
-    if limit:
-        batch_query = batch_query.replace(";", f"LIMIT {limit} ;")
-    with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
-        try:
-            batch_result = db_cursor.execute(batch_query)
-            batch_queue = batch_result.fetchall()
-        except sqlite3.Error:
-            logger.error("SQLite transcode selection query failed.")
-            logger.exception(sqlite3.Error)
-            raise SystemExit(1) from sqlite3.Error
-        else:
-            db_cursor.close()
-            logger.info("Successfully retrieved batch of files to transcode.")
-            return batch_queue
+
+def get_exiftool() -> ExiftoolDaemon:
+    """Get the exiftool process of the current thread.
+
+    Returns:
+        ExiftoolDaemon started on the first query of the thread.
+    """
+    daemon = getattr(exiftool_local, "daemon", None)
+    if daemon is None:
+        daemon = ExiftoolDaemon()
+        exiftool_local.daemon = daemon
+        exiftool_daemons.append(daemon)
+    return daemon
 
 
 def get_file_size(filename: str) -> int:
@@ -241,51 +531,185 @@ def get_file_size(filename: str) -> int:
     Returns:
         int of size in bytes
     """
-    byte_size = Path(filename).stat().st_size
-    gigabyte = 1073741824
-    megabyte = 1048576
-
-    if byte_size >= gigabyte:
-        human_size = int(byte_size/(1024*1024*1024))
-        human_size_msg = f"'{filename}' is {human_size}GB."
-    elif byte_size >= megabyte:
-        human_size = int(byte_size/(1024*1024))
-        human_size_msg = f"'{filename}' is {human_size}MB."
+    byte_size = os.stat(filename).st_size
+    if not logger.isEnabledFor(logging.INFO):
+        return byte_size
+
+    if byte_size >= 1 << 30:
+        logger.info("'%s' is %sGB.", filename, byte_size >> 30)
+    elif byte_size >= 1 << 20:
+        logger.info("'%s' is %sMB.", filename, byte_size >> 20)
     else:
-        human_size_msg = f"'{filename}' is {byte_size:,}B."
-    logger.info(human_size_msg)
+        logger.info("'%s' is %sB.", filename, f"{byte_size:,}")
     return byte_size
 
 
 def insert_scan_results(sqlite_db: str, insert_list: list) -> None:
     """Insert scan results list into SQLite database.
 
+    Rows are committed in chunks of INSERT_CHUNK, and duplicate filenames are ignored.
+
     Args:
         sqlite_db (str): SQLite database file to use.
         insert_list (list): list containing a list of scan results.
     """
-    insert_statement = """INSERT INTO queue (
-                                path, filename, transcode, status)
-                            VALUES (
-                                ?, ?, ?, ?) ;
-    """
-
     logger.debug("Inserting scanned results into SQLite database.")
 
-    with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
+    inserted = 0
+    with DatabaseInterface(sqlite_db) as (connection, db_cursor):
         try:
-            db_cursor.executemany(insert_statement, insert_list)
-        except sqlite3.IntegrityError:
-            logger.error("Duplicate filename found in SQLite table.")
+            for chunk in chunks(insert_list, INSERT_CHUNK):
+                with connection:
+                    db_cursor.executemany(INSERT_STATEMENT, chunk)
+                inserted += db_cursor.rowcount
         except sqlite3.Error:
             logger.error("SQLite insert execution failed.")
             logger.exception(sqlite3.Error)
             raise SystemExit(1) from sqlite3.Error
         else:
             db_cursor.close()
-        finally:
-            insert_msg = f"Successfully inserted {len(insert_list)} entries into SQLite 'queue' table."
-            logger.info(insert_msg)
+
+    logger.info("Successfully inserted %s entries into SQLite 'queue' table.", inserted)
+    if inserted < len(insert_list):
+        logger.warning("Ignored %s duplicate filename(s) found in SQLite table.", len(insert_list) - inserted)
+
+
+def iter_boxes(data: mmap.mmap, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """Iterate the ISO-BMFF (MP4) boxes between two offsets.
+
+    Args:
+        data (mmap): memory-mapped video file.
+        start (int): offset of the first box.
+        end (int): offset where the boxes end.
+
+    Yields:
+        Tuple of the box type, offset of the box content, and offset of the box end.
+    """
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header or start + size > end:
+            return
+        yield box_type, start + header, start + size
+        start += size
+
+
+def iter_videos(scan_path: str) -> Iterator[tuple[str, str]]:
+    """Recursively find video files, without following symlinked directories.
+
+    Args:
+        scan_path (str): directory to scan.
+
+    Yields:
+        Tuple of the absolute path and filename of each video file.
+    """
+    try:
+        with os.scandir(scan_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_videos(entry.path)
+                elif entry.name.endswith(VIDEO_EXTENSIONS):
+                    logger.info("Found '%s/%s'.", scan_path, entry.name)
+                    yield scan_path, entry.name
+    except OSError:
+        logger.warning("Unable to scan '%s'. Skipping directory.", scan_path)
+
+
+def peek_codec(video_file: str) -> str | None:
+    """Read the video codec from the MP4 container, without exiftool.
+
+    Follows 'moov/trak/mdia/minf/stbl/stsd' of the first video track,
+    and reads the type of its sample entry (i.e.: 'hvc1', 'avc1').
+
+    Args:
+        video_file (str): video file to check.
+
+    Returns:
+        The lowercase sample entry type, or None if the file can't be parsed.
+    """
+    try:
+        with (Path(video_file).open(mode="rb") as video,
+              mmap.mmap(video.fileno(), 0, prot=mmap.PROT_READ) as data):
+            moov = find_box(data, 0, len(data), b"moov")
+            if moov is None:
+                return None
+            for box_type, trak_start, trak_end in iter_boxes(data, *moov):
+                if box_type != b"trak":
+                    continue
+                mdia = find_box(data, trak_start, trak_end, b"mdia")
+                hdlr = mdia and find_box(data, *mdia, b"hdlr")
+                # 'hdlr' holds the version/flags, pre_defined, then the handler type
+                if not hdlr or data[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+                    continue
+                stsd = mdia
+                for child_type in (b"minf", b"stbl", b"stsd"):
+                    stsd = stsd and find_box(data, *stsd, child_type)
+                if not stsd:
+                    return None
+                # 'stsd' holds the version/flags, entry count, then the first entry's size and type
+                return data[stsd[0] + 12:stsd[0] + 16].decode("ascii").lower()
+    except (OSError, ValueError, struct.error):
+        return None
+    return None
+
+
+@functools.cache
+def probe_encoders() -> str:
+    """Find the preferred hardware HEVC encoder that works on this host.
+
+    ffmpeg lists the encoders it was built with, even without the hardware.
+    Each encoder is tried with a short trial encode, in order of preference.
+    The result is only probed once, and reused for every video file.
+
+    Returns:
+        Name of the hardware encoder, or "libx265" if none of them work.
+    """
+    for encoder, (input_options, _encoder_options) in HW_ENCODERS.items():
+        probe_cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        # Test frames are created in system memory, not decoded on the GPU
+        for option, value in input_options.items():
+            if option != "hwaccel_output_format":
+                probe_cmd += [f"-{option}", value]
+        probe_cmd += [*HW_PROBE_INPUT, *HW_PROBE_OPTIONS.get(encoder, []),
+                      "-codec:v", encoder, "-f", "null", "-"]
+        try:
+            subprocess.run(probe_cmd,
+                           capture_output = True,
+                           check = True,
+                           timeout = 30)
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            logger.debug("Hardware encoder '%s' is not available.", encoder)
+            continue
+        logger.info("Using hardware encoder '%s'.", encoder)
+        return encoder
+
+    logger.warning("No working hardware HEVC encoder found. Using 'libx265'.")
+    return "libx265"
+
+
+def query_all(sqlite_db: str, query: str, params: tuple = ()) -> list:
+    """Run a SELECT query, and fetch all of its rows.
+
+    Args:
+        sqlite_db (str): SQLite database file to use.
+        query (str): SQL query to run.
+        params (tuple): values bound to the query placeholders.
+
+    Returns:
+        List of tuples containing the query results.
+    """
+    with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
+        try:
+            return db_cursor.execute(query, params).fetchall()
+        except sqlite3.Error:
+            logger.error("SQLite query failed: %s", query)
+            logger.exception(sqlite3.Error)
+            raise SystemExit(1) from sqlite3.Error
 
 
 def read_metadata(path: str, filename: str) -> tuple:
@@ -299,33 +723,26 @@ def read_metadata(path: str, filename: str) -> tuple:
         Tuple of the filename and transcoding status.
     """
     video_file = f"{path}/{filename}"
+    compressor_metadata = peek_codec(video_file)
     try:
-        reader_cmd = ["/usr/bin/exiftool",
-                      "-api", "largefilesupport",
-                      "-s3", "-CompressorID",
-                      video_file]
-        metadata_sp = subprocess.run(reader_cmd,
-                                        capture_output = True,
-                                        check = True,
-                                        text = True)
-        compressor_metadata = metadata_sp.stdout.lower().strip()
+        if compressor_metadata is None:
+            reader_args = ["-api", "largefilesupport",
+                           "-s3", "-CompressorID",
+                           video_file]
+            compressor_metadata = get_exiftool().query(reader_args).lower().strip()
     except subprocess.CalledProcessError:
-        non_video_msg = f"'{video_file}' is not a not a video file. Verify file type."
-        logger.error(non_video_msg)
+        logger.error("'%s' is not a not a video file. Verify file type.", video_file)
         result = (filename, "N", "unknown")
     else:
         if compressor_metadata == "hvc1":
-            transcoded_msg = f"'{video_file}' is already transcoded."
-            logger.info(transcoded_msg)
+            logger.info("'%s' is already transcoded.", video_file)
             result = (filename, "N", "skipped")
         elif compressor_metadata == "":
-            unknown_msg = f"'{video_file}' returned empty Compressor ID. Verifying video integrity."
-            logger.warning(unknown_msg)
+            logger.warning("'%s' returned empty Compressor ID. Verifying video integrity.", video_file)
             verified_status = verify_metadata(video_file)
             result = (filename, *verified_status)
         else:
-            transcode_msg = f"'{video_file}' needs to be transcoded."
-            logger.info(transcode_msg)
+            logger.info("'%s' needs to be transcoded.", video_file)
             result = (filename, "Y", "queued")
     return result
 
@@ -339,21 +756,9 @@ def retry_failed(sqlite_db: str) -> list:
     Returns:
         list of tuples containing the path and filename of failed transcoding.
     """
-    failed_status_query = "SELECT path, filename FROM queue WHERE status = 'failed';"
-
-    with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
-        try:
-            failed_status_result = db_cursor.execute(failed_status_query)
-            failed_status_data = failed_status_result.fetchall()
-        except sqlite3.Error:
-            logger.error("SQLite status query failed.")
-            logger.exception(sqlite3.Error)
-        else:
-            db_cursor.close()
-
+    failed_status_data = query_all(sqlite_db, FAILED_QUERY)
     if failed_status_data:
-        failed_results_msg = f"Found {len(failed_status_data)} failed transcoding(s)."
-        logger.info(failed_results_msg)
+        logger.info("Found %s failed transcoding(s).", len(failed_status_data))
     else:
         logger.info("No failed transcodings.")
 
@@ -363,46 +768,49 @@ def retry_failed(sqlite_db: str) -> list:
 def scan_directory(sqlite_db: str) -> None:
     """Scan for video files.
 
-    Creates a tuple of the absolute path and filename,
-    then appends to the list of the scan results.
+    Found video files are checked for their metadata, and inserted into
+    the SQLite database in chunks of SCAN_CHUNK while the scan continues.
+    Each chunk is inserted while the next chunk is walked and checked.
 
     Args:
         sqlite_db (str): SQLite database file to use.
-
-    Returns:
-        List of tuples containing the absolute path and filename.
     """
-    scan_path = "/mnt"
-    video_extensions = (".mkv", ".mp4")
-    video_list = []
-    queue_list = []
+    video_count = 0
+    videos = iter_videos(SCAN_PATH)
 
     logger.info("Beginning scan...")
-    for root, _dirs, files in os.walk(scan_path):
-        for filename in files:
-            if filename.endswith(video_extensions):
-                video_list.append((root, filename))
-                found_msg = f"Found '{root}/{filename}'."
-                logger.info(found_msg)
-    scan_results_msg = f"Scan complete. Found {len(video_list)} video file(s)."
-    logger.info(scan_results_msg)
-
-    if len(video_list) == 0:
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        pending_checks = []
+        for video_list in chunks(videos, SCAN_CHUNK):
+            video_count += len(video_list)
+            logger.debug("Checking metadata on video files.")
+            video_checks = [(path, executor.submit(check_video, path, filename))
+                            for path, filename in video_list]
+
+            if pending_checks:
+                insert_scan_results(sqlite_db, [(path, *check.result()) for path, check in pending_checks])
+            pending_checks = video_checks
+
+        if pending_checks:
+            insert_scan_results(sqlite_db, [(path, *check.result()) for path, check in pending_checks])
+
+    for daemon in exiftool_daemons:
+        daemon.close()
+    logger.info("Scan complete. Found %s video file(s).", video_count)
+
+    if video_count == 0:
         logger.warning("Empty scan results. Is the volume mounted? Exiting.")
         raise SystemExit(1)
 
-    logger.debug("Checking metadata on video files.")
-    for result in video_list:
-        path = result[0]
-        filename = result[1]
-        if filename.endswith(".mkv"):
-            transcode_msg = f"'{path}/{filename}' needs to be transcoded."
-            logger.info(transcode_msg)
-            queue_list.append([path, filename, "Y", "queued"])
+    # Refresh the statistics for the query planner to use the indexes
+    with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
+        try:
+            db_cursor.execute(ANALYZE_STATEMENT)
+        except sqlite3.Error:
+            logger.error("SQLite queue analysis failed.")
+            logger.exception(sqlite3.Error)
         else:
-            filename, transcode, status = read_metadata(path, filename)
-            queue_list.append([path, filename, transcode, status])
-    insert_scan_results(sqlite_db, queue_list)
+            db_cursor.close()
 
 
 def setup_database(sqlite_db: str) -> int:
@@ -420,8 +828,7 @@ def setup_database(sqlite_db: str) -> int:
         with Path(schema_file).open(mode="r", encoding="utf-8") as db_schema:
             create_table = db_schema.read()
     except FileNotFoundError:
-        file_not_found_msg = f"Schema file not found. Expected: '{schema_file}'."
-        logger.error(file_not_found_msg)
+        logger.error("Schema file not found. Expected: '%s'.", schema_file)
         raise SystemExit(1) from FileNotFoundError
     else:
         with DatabaseInterface(sqlite_db) as (connection, cursor):
@@ -431,20 +838,57 @@ def setup_database(sqlite_db: str) -> int:
         return 0
 
 
+def transcode_file(sqlite_db: str, path: str, filename: str) -> str:
+    """Transcode a single video file, and delete the original if enabled.
+
+    Args:
+        sqlite_db (str): SQLite database file to use.
+        path (str): the absolute path to the video file.
+        filename (str): the video filename.
+
+    Returns:
+        transcode_status: "done" for success, "failed" for errors.
+    """
+    video_file = Transcode(sqlite_db, path, filename)
+    transcode_video = video_file.transcode()
+    if (transcode_video == "done") and (DELETE):
+        video_file.delete_original()
+    return transcode_video
+
+
 def transcode_queue(sqlite_db: str, queue_list: list) -> None:
     """Transcode the list of files.
 
+    Up to PARALLEL files are transcoded at the same time, each in its own process.
+    The final status of each file is written as soon as its transcoding ends.
+    Transcodings that end together are written in a single transaction.
+
     Args:
         sqlite_db (str): SQLite database file to use.
         queue_list (list): list of tuples containing a path and filename.
     """
-    for entry in queue_list:
-        path = entry[0]
-        filename = entry[1]
-        video_file = Transcode(sqlite_db, path, filename)
-        transcode_video = video_file.transcode()
-        if (transcode_video == "done") and (DELETE):
-            video_file.delete_original()
+    workers = max(1, min(PARALLEL, len(queue_list)))
+    logger.info("Transcoding %s file(s) with %s worker(s).", len(queue_list), workers)
+    if HW_ACCEL:
+        probe_encoders()
+    status_writer = StatusWriter(sqlite_db)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(transcode_file, sqlite_db, path, filename): (path, filename)
+                   for path, filename in queue_list}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, filename = futures[future]
+                try:
+                    transcode_status = future.result()
+                # The worker process may raise any exception, or die entirely
+                except Exception:
+                    logger.error("Transcoding worker failed for '%s/%s'.", path, filename)
+                    logger.debug("Transcoding worker exception.", exc_info=True)
+                    transcode_status = "failed"
+                status_writer.queue(path, filename, transcode_status)
+            status_writer.flush()
 
 
 def update_metadata(sqlite_db: str) -> None:
@@ -453,18 +897,8 @@ def update_metadata(sqlite_db: str) -> None:
     Args:
         sqlite_db (str): SQLite database file to use.
     """
-    metadata_query = "SELECT path, filename FROM queue ;"
-    with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
-        try:
-            metadata_result = db_cursor.execute(metadata_query)
-            metadata_queue = metadata_result.fetchall()
-        except sqlite3.Error:
-            logger.error("SQLite metadata query failed.")
-            logger.exception(sqlite3.Error)
-            raise SystemExit(1) from sqlite3.Error
-        else:
-            db_cursor.close()
-            logger.debug("Successfully retrieved list of files to update metadata.")
+    metadata_queue = query_all(sqlite_db, METADATA_QUERY)
+    logger.debug("Successfully retrieved list of files to update metadata.")
 
     for file in metadata_queue:
         path = file[0]
@@ -473,24 +907,17 @@ def update_metadata(sqlite_db: str) -> None:
         if filename.endswith(".mp4"):
             try:
                 video_title = filename.removesuffix(".mp4")
-                update_metadata_cmd = ["/usr/bin/exiftool",
-                                        "-overwrite_original",
+                update_metadata_args = ["-overwrite_original",
                                         f"-title={video_title}",
                                         "-comment=",
                                         video_file]
-                subprocess.run(update_metadata_cmd,
-                                capture_output = True,
-                                check = True,
-                                text = True)
+                get_exiftool().query(update_metadata_args)
             except subprocess.CalledProcessError:
-                update_metadata_err = f"Invalid MP4 file type for '{video_file}'. Transcode to update the metadata."
-                logger.error(update_metadata_err)
+                logger.error("Invalid MP4 file type for '%s'. Transcode to update the metadata.", video_file)
             else:
-                update_metadata_msg = f"Updated metadata for '{video_file}'."
-                logger.info(update_metadata_msg)
+                logger.info("Updated metadata for '%s'.", video_file)
         else:
-            file_type_warn = f"'{video_file}' is not MP4. Transcode to update the metadata."
-            logger.warning(file_type_warn)
+            logger.warning("'%s' is not MP4. Transcode to update the metadata.", video_file)
 
 
 def update_status(sqlite_db: str, path: str, filename: str, status: str) -> None:
@@ -502,24 +929,17 @@ def update_status(sqlite_db: str, path: str, filename: str, status: str) -> None
         filename (str): filename for the video file.
         status (str): new status for the video file.
     """
-    status_update_query = """UPDATE queue
-                                SET status = ?
-                                WHERE path = ? AND
-                                filename = ? ;
-    """
     status_update_data = (status, path, filename)
     with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
         try:
-            db_cursor.execute(status_update_query, status_update_data)
+            db_cursor.execute(STATUS_UPDATE_QUERY, status_update_data)
         except sqlite3.Error:
-            update_query_msg = f"{status_update_data=}"
-            logger.debug(update_query_msg)
+            logger.debug("status_update_data=%r", status_update_data)
             logger.error("SQLite transcode status update failed.")
             logger.exception(sqlite3.Error)
         else:
             db_cursor.close()
-            sql_update_msg = f"Updated status for '{path}/{filename}' to '{status}'."
-            logger.info(sql_update_msg)
+            logger.info("Updated status for '%s/%s' to '%s'.", path, filename, status)
 
 
 def verify_database() -> int:
@@ -532,13 +952,11 @@ def verify_database() -> int:
     setup_database(sqlite_db)
 
     queue_count = 0
-    query_queue = "SELECT COUNT(*) FROM queue ;"
     with DatabaseInterface(sqlite_db) as (_connect, db_cursor):
         try:
-            queue_result = db_cursor.execute(query_queue)
+            queue_result = db_cursor.execute(QUEUE_COUNT_QUERY)
         except sqlite3.Error:
-            verification_err_msg = f"SQLite database verification failed for '{sqlite_db}'."
-            logger.error(verification_err_msg)
+            logger.error("SQLite database verification failed for '%s'.", sqlite_db)
             raise SystemExit(1) from sqlite3.Error
         else:
             result = queue_result.fetchall()[0][0]
@@ -557,20 +975,13 @@ def verify_metadata(filename: str) -> tuple:
     Returns:
         A tuple containing the transcode and queue status values.
     """
-    file_type_cmd = ["/usr/bin/exiftool",
-                     "-s3", "-DocType",
-                     filename]
-    file_type_sp = subprocess.run(file_type_cmd,
-                                    capture_output = True,
-                                    check = True,
-                                    text = True)
-    file_type = file_type_sp.stdout.lower().strip()
+    file_type_args = ["-s3", "-DocType",
+                      filename]
+    file_type = get_exiftool().query(file_type_args).lower().strip()
     if file_type == "matroska":
-        filetype_mkv_msg = f"'{filename}' is MKV file type, not MP4. Queued for transcoding."
-        logger.warning(filetype_mkv_msg)
+        logger.warning("'%s' is MKV file type, not MP4. Queued for transcoding.", filename)
         transcode_status = ("Y", "queued")
     else:
-        filetype_unknown_msg = f"'{filename}' is '{file_type}' type. Status is unknown."
-        logger.error(filetype_unknown_msg)
+        logger.error("'%s' is '%s' type. Status is unknown.", filename, file_type)
         transcode_status = ("N", "unknown")
     return transcode_status